@@ -3,11 +3,16 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
+
+from . import assets
+from .campus import CampusSession, campus_bind_key, parse_campus_database_urls
 
 load_dotenv()
 
 # Global SQLAlchemy instance so models can import it
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": CampusSession})
 
 
 def create_app(test_config: dict | None = None) -> Flask:
@@ -20,15 +25,68 @@ def create_app(test_config: dict | None = None) -> Flask:
             "DATABASE_URL",
         ),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        DEFAULT_CAMPUS=os.getenv("DEFAULT_CAMPUS", "main"),
+        CAMPUSES=[c.strip() for c in os.getenv("CAMPUSES", "").split(",") if c.strip()],
+        CAMPUS_DATABASE_URLS=parse_campus_database_urls(os.getenv("CAMPUS_DATABASE_URLS")),
+        JINJA_BYTECODE_CACHE_DIR=os.getenv(
+            "JINJA_BYTECODE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache")
+        ),
+        PRECOMPILE_TEMPLATES=os.getenv("PRECOMPILE_TEMPLATES", "").lower() in {"1", "true", "yes"},
+        SQLITE_WAL=os.getenv("SQLITE_WAL", "1").lower() in {"1", "true", "yes"},
     )
 
     if test_config:
         app.config.update(test_config)
 
+    # Compiled templates survive worker restarts, so a fresh worker only
+    # unmarshals bytecode instead of parsing and compiling every template.
+    cache_dir = app.config["JINJA_BYTECODE_CACHE_DIR"]
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_options = {
+            **app.jinja_options,
+            "bytecode_cache": FileSystemBytecodeCache(cache_dir),
+        }
+
+    # Campuses with their own database are registered as extra binds and
+    # selected per request by CampusSession.
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for campus, url in app.config["CAMPUS_DATABASE_URLS"].items():
+        binds[campus_bind_key(campus)] = url
+        if campus not in app.config["CAMPUSES"]:
+            app.config["CAMPUSES"].append(campus)
+    app.config["SQLALCHEMY_BINDS"] = binds
+
     db.init_app(app)
 
-    from . import routes
+    # In WAL mode readers never block writers, so a long streamed listing or
+    # an online backup does not stall requests that write.
+    if app.config["SQLITE_WAL"]:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == "sqlite":
+                    event.listen(engine, "connect", _use_wal)
+
+    assets.init_app(app)
+
+    from . import backup, jobs, routes, validation
+
+    backup.init_app(app)
+    jobs.init_app(app)
+    validation.init_app(app)
 
     app.register_blueprint(routes.bp)
 
+    # With gunicorn --preload this runs once in the master and is shared by
+    # every forked worker.
+    if app.config["PRECOMPILE_TEMPLATES"]:
+        for name in app.jinja_env.list_templates(extensions=["html"]):
+            app.jinja_env.get_template(name)
+
     return app
+
+
+def _use_wal(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import zlib
+from collections.abc import Iterator
+
+import click
+from flask import Flask, Response, abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+HASH_LENGTH = 12
+ONE_YEAR = 365 * 24 * 60 * 60
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg", ".map", ".txt", ".json"}
+HTML_MIN_SIZE = 500
+
+# Accept-Encoding token -> file suffix of the pre-compressed variant, best first.
+_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def init_app(app: Flask) -> None:
+    """Register fingerprinted asset serving, the asset_url helper and HTML compression."""
+    app.extensions["asset_manifest"] = build_manifest(app.static_folder)
+    app.add_url_rule("/assets/<path:filename>", endpoint="asset", view_func=serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+    app.after_request(compress_html)
+    app.cli.add_command(compress_assets_command)
+
+
+def build_manifest(static_folder: str) -> dict[str, str]:
+    """Map each static file (relative path) to the first characters of its SHA-256."""
+    manifest: dict[str, str] = {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as fh:
+                digest = hashlib.sha256(fh.read()).hexdigest()[:HASH_LENGTH]
+            manifest[os.path.relpath(path, static_folder).replace(os.sep, "/")] = digest
+    return manifest
+
+
+def asset_url(filename: str) -> str:
+    """Return the content-hashed URL for a static file, e.g. ``css/style.<hash>.css``."""
+    digest = current_app.extensions["asset_manifest"].get(filename)
+    if digest is None:
+        return url_for("static", filename=filename)
+    stem, ext = os.path.splitext(filename)
+    return url_for("asset", filename=f"{stem}.{digest}{ext}")
+
+
+def serve_asset(filename: str) -> Response:
+    """Serve a fingerprinted asset, preferring a pre-compressed variant."""
+    stem, ext = os.path.splitext(filename)
+    logical, _, digest = stem.rpartition(".")
+    logical += ext
+    manifest = current_app.extensions["asset_manifest"]
+    if not logical or logical not in manifest:
+        abort(404)
+
+    static_folder = current_app.static_folder
+    served, encoding = logical, None
+    for token, suffix in _VARIANTS:
+        if token in request.accept_encodings and _fresh_variant(
+            os.path.join(static_folder, logical), suffix
+        ):
+            served, encoding = logical + suffix, token
+            break
+
+    response = send_from_directory(
+        static_folder,
+        served,
+        mimetype=mimetypes.guess_type(logical)[0] or "application/octet-stream",
+        max_age=ONE_YEAR,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if digest == manifest[logical]:
+        response.headers["Cache-Control"] = f"public, max-age={ONE_YEAR}, immutable"
+    else:
+        # A page from an older deploy asked for content that has since changed.
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _fresh_variant(path: str, suffix: str) -> bool:
+    """Whether a compressed variant exists and is not older than its source file."""
+    try:
+        return os.path.getmtime(path + suffix) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def compress_html(response: Response) -> Response:
+    """Gzip HTML responses for clients that accept it, keeping streamed ones streamed."""
+    if (
+        response.mimetype != "text/html"
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or "gzip" not in request.accept_encodings
+    ):
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_stream(response.iter_encoded())
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    body = response.get_data()
+    if len(body) < HTML_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a streamed body, sync-flushing after each chunk so the browser can render it."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@click.command("compress-assets")
+@with_appcontext
+def compress_assets_command() -> None:
+    """Write .gz (and .br when brotli is installed) variants next to static files."""
+    try:  # brotli is optional; without it only gzip variants are written
+        import brotli
+    except ImportError:
+        brotli = None
+
+    static_folder = current_app.static_folder
+    written = 0
+    for logical in build_manifest(static_folder):
+        if os.path.splitext(logical)[1] not in COMPRESSIBLE_SUFFIXES:
+            continue
+        path = os.path.join(static_folder, logical)
+        with open(path, "rb") as fh:
+            data = fh.read()
+        with open(path + ".gz", "wb") as fh:
+            fh.write(gzip.compress(data, compresslevel=9, mtime=0))
+        written += 1
+        if brotli is not None:
+            with open(path + ".br", "wb") as fh:
+                fh.write(brotli.compress(data, quality=11))
+            written += 1
+    click.echo(f"Wrote {written} compressed asset variants.")
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+import click
+from flask import Flask
+from flask.cli import with_appcontext
+from sqlalchemy.engine import Engine
+
+from . import db
+from .campus import campus_bind_key
+
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.01
+MAX_RESTARTS = 5
+
+
+def init_app(app: Flask) -> None:
+    """Register the backup, restore and verify CLI commands."""
+    app.cli.add_command(backup_command)
+    app.cli.add_command(restore_command)
+    app.cli.add_command(verify_command)
+
+
+def sqlite_path(engine: Engine) -> str:
+    """Return the file path behind a SQLite engine, rejecting other databases."""
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        raise click.ClickException("Online backup is only available for file-based SQLite.")
+    return url.database
+
+
+class BackupInterrupted(Exception):
+    """The source kept changing under an incremental copy in rollback-journal mode."""
+
+
+def online_backup(
+    source_path: str,
+    target_path: str,
+    pages: int = PAGES_PER_STEP,
+    pause: float = STEP_PAUSE,
+    progress: Callable[[int, int], None] | None = None,
+    max_restarts: int = MAX_RESTARTS,
+) -> None:
+    """Copy a live SQLite database with the backup API, ``pages`` at a time.
+
+    In WAL mode the source connection holds one read transaction for the
+    whole copy. Every step then reads the same snapshot, so other
+    connections' commits no longer restart the copy, and the open read does
+    not block writers.
+
+    In rollback-journal mode that open read would block writers, so the lock
+    is released between steps and each write restarts the copy. After each
+    restart the pause doubles until a step makes progress again. After
+    ``max_restarts`` restarts BackupInterrupted is raised. The copy never
+    falls back to a single step that would lock writers out.
+    """
+    restarts = 0
+    last_copied = 0
+    delay = pause
+
+    def step(status: int, remaining: int, total: int) -> None:
+        nonlocal restarts, last_copied, delay
+        copied = total - remaining
+        if copied <= last_copied:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupInterrupted(
+                    f"The database changed {restarts} times during the backup. Enable WAL "
+                    "(SQLITE_WAL=1) or retry when there are fewer writes."
+                )
+            delay = max(delay, STEP_PAUSE) * 2
+        else:
+            delay = pause
+        last_copied = copied
+        if progress is not None:
+            progress(copied, total)
+        if delay:
+            time.sleep(delay)
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    try:
+        (journal_mode,) = source.execute("PRAGMA journal_mode").fetchone()
+        if journal_mode.lower() == "wal":
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, progress=step)
+    finally:
+        target.close()
+        source.close()
+
+
+def integrity_errors(path: str) -> list[str]:
+    """Run PRAGMA integrity_check on a (possibly gzipped) snapshot."""
+    with _opened_snapshot(path) as plain_path:
+        conn = sqlite3.connect(f"file:{plain_path}?mode=ro", uri=True)
+        try:
+            rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+    return [] if rows == ["ok"] else rows
+
+
+@contextmanager
+def _opened_snapshot(path: str) -> Iterator[str]:
+    """Yield a plain SQLite path for a snapshot, decompressing ``.gz`` to a temp file."""
+    if not path.endswith(".gz"):
+        yield path
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+            shutil.copyfileobj(src, out)
+        yield tmp_path
+    finally:
+        os.unlink(tmp_path)
+
+
+def _campus_engine(campus: str | None) -> Engine:
+    if campus:
+        engine = db.engines.get(campus_bind_key(campus))
+        if engine is None:
+            raise click.ClickException(f"Campus '{campus}' has no database of its own.")
+        return engine
+    return db.engine
+
+
+def _echo_progress(copied: int, total: int) -> None:
+    click.echo(f"\r  {copied}/{total} pages", nl=False)
+
+
+@click.command("db-backup")
+@with_appcontext
+@click.argument("target")
+@click.option("--campus", help="Back up a campus database instead of the default one.")
+@click.option("--pages", default=PAGES_PER_STEP, show_default=True, help="Pages per step.")
+@click.option("--pause", default=STEP_PAUSE, show_default=True, help="Seconds between steps.")
+@click.option("--compress", is_flag=True, help="Gzip the snapshot (adds .gz).")
+@click.option("--force", is_flag=True, help="Overwrite TARGET if it already exists.")
+def backup_command(
+    target: str, campus: str | None, pages: int, pause: float, compress: bool, force: bool
+):
+    """Take a consistent snapshot of the SQLite database while the app keeps running."""
+    source_path = sqlite_path(_campus_engine(campus))
+    if compress and not target.endswith(".gz"):
+        target += ".gz"
+    compress = target.endswith(".gz")
+    if os.path.realpath(target) == os.path.realpath(source_path):
+        raise click.ClickException("The backup target is the live database itself.")
+    if os.path.exists(target) and not force:
+        raise click.ClickException(f"{target} already exists; pass --force to overwrite it.")
+
+    # Build the snapshot in a temp file next to the target and move it into
+    # place only once it has passed the integrity check.
+    fd, snapshot_path = tempfile.mkstemp(
+        suffix=".db", dir=os.path.dirname(os.path.abspath(target))
+    )
+    os.close(fd)
+    staged = [snapshot_path]
+    try:
+        started = time.perf_counter()
+        try:
+            online_backup(
+                source_path, snapshot_path, pages=pages, pause=pause, progress=_echo_progress
+            )
+        except BackupInterrupted as exc:
+            raise click.ClickException(str(exc)) from exc
+        finally:
+            click.echo()
+        errors = integrity_errors(snapshot_path)
+        if errors:
+            raise click.ClickException("Snapshot failed integrity check: " + "; ".join(errors))
+
+        if compress:
+            staged.append(snapshot_path + ".gz")
+            with open(snapshot_path, "rb") as src, gzip.open(staged[-1], "wb") as out:
+                shutil.copyfileobj(src, out)
+        os.replace(staged[-1], target)
+    finally:
+        for path in staged:
+            if os.path.exists(path):
+                os.unlink(path)
+    click.echo(f"Wrote {target} in {time.perf_counter() - started:.2f}s.")
+
+
+@click.command("db-verify")
+@with_appcontext
+@click.argument("snapshot")
+def verify_command(snapshot: str) -> None:
+    """Check that a snapshot (plain or .gz) is a healthy SQLite database."""
+    errors = integrity_errors(snapshot)
+    if errors:
+        raise click.ClickException("; ".join(errors))
+    with _opened_snapshot(snapshot) as plain_path:
+        conn = sqlite3.connect(f"file:{plain_path}?mode=ro", uri=True)
+        try:
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+            ):
+                (count,) = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()
+                click.echo(f"  {name}: {count} rows")
+        finally:
+            conn.close()
+    click.echo(f"{snapshot} is OK.")
+
+
+@click.command("db-restore")
+@with_appcontext
+@click.argument("snapshot")
+@click.option("--campus", help="Restore into a campus database instead of the default one.")
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation.")
+def restore_command(snapshot: str, campus: str | None, yes: bool) -> None:
+    """Replace the live database contents with a verified snapshot."""
+    target_path = sqlite_path(_campus_engine(campus))
+    errors = integrity_errors(snapshot)
+    if errors:
+        raise click.ClickException("Snapshot failed integrity check: " + "; ".join(errors))
+    if not yes:
+        click.confirm(f"Overwrite {target_path} with {snapshot}?", abort=True)
+
+    # Restoring through the backup API (rather than copying the file) keeps
+    # open connections valid and takes the write lock only while copying.
+    with _opened_snapshot(snapshot) as plain_path:
+        online_backup(plain_path, target_path, pages=-1, pause=0)
+    click.echo(f"Restored {target_path} from {snapshot}.")
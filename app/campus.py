@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import typing as t
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+
+CAMPUS_BIND_PREFIX = "campus_"
+
+
+def campus_bind_key(campus: str) -> str:
+    """Return the SQLALCHEMY_BINDS key used for a campus-specific database."""
+    return f"{CAMPUS_BIND_PREFIX}{campus}"
+
+
+def parse_campus_database_urls(raw: str | None) -> dict[str, str]:
+    """Parse ``campus=url,campus=url`` into a mapping of campus code to URL."""
+    urls: dict[str, str] = {}
+    for item in (raw or "").split(","):
+        code, sep, url = item.partition("=")
+        if sep and code.strip() and url.strip():
+            urls[code.strip()] = url.strip()
+    return urls
+
+
+def configured_campuses() -> list[str]:
+    """Return the campus codes known to the current app, default campus first."""
+    default = current_app.config["DEFAULT_CAMPUS"]
+    campuses = [default]
+    for code in current_app.config.get("CAMPUSES", []):
+        if code not in campuses:
+            campuses.append(code)
+    return campuses
+
+
+def current_campus() -> str:
+    """Return the campus the current request (or CLI command) operates on."""
+    campus = getattr(g, "campus", None)
+    return campus or current_app.config["DEFAULT_CAMPUS"]
+
+
+class CampusSession(Session):
+    """Session that routes queries to a campus's own database when one is configured.
+
+    Campuses without an entry in ``CAMPUS_DATABASE_URLS`` share the default bind and
+    are separated by their ``campus`` column only.
+    """
+
+    def get_bind(
+        self,
+        mapper: t.Any | None = None,
+        clause: t.Any | None = None,
+        bind: sa.engine.Engine | sa.engine.Connection | None = None,
+        **kwargs: t.Any,
+    ) -> sa.engine.Engine | sa.engine.Connection:
+        if bind is None and has_app_context():
+            campus = getattr(g, "campus", None)
+            if campus:
+                engine = self._db.engines.get(campus_bind_key(campus))
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import heapq
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from datetime import datetime
+
+from flask import current_app
+
+from . import db
+from .models import Lesson, Shift, Student, User
+
+FEED_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Rendered feeds keyed by (campus, teacher id); each entry remembers the
+# schedule stamp it was rendered for so a changed schedule misses the cache.
+# Least recently served feeds are evicted once the bodies exceed
+# FEED_CACHE_MAX_BYTES, so memory per worker stays bounded.
+_feed_cache: OrderedDict[tuple[str, int], tuple[str, bytes]] = OrderedDict()
+_feed_cache_bytes = 0
+_feed_cache_lock = threading.Lock()
+
+_STREAM_BATCH_SIZE = 500
+
+
+def feed_etag(teacher: User) -> str:
+    """Build the feed ETag from the teacher's last-change stamp, without rendering."""
+    stamp = teacher.schedule_updated_at
+    return f"{teacher.campus}-{teacher.id}-{stamp.strftime('%Y%m%d%H%M%S%f') if stamp else 0}"
+
+
+def cached_feed(teacher: User, etag: str) -> bytes | None:
+    """Return the rendered feed if it was rendered for the current stamp."""
+    key = (teacher.campus, teacher.id)
+    with _feed_cache_lock:
+        entry = _feed_cache.get(key)
+        if entry and entry[0] == etag:
+            _feed_cache.move_to_end(key)
+            return entry[1]
+    return None
+
+
+def forget_feed(campus: str, teacher_id: int) -> None:
+    """Drop a teacher's cached feed, e.g. once the teacher is deleted."""
+    with _feed_cache_lock:
+        _discard(campus, teacher_id)
+
+
+def stream_feed(teacher: User, etag: str) -> Iterator[bytes]:
+    """Yield the feed in chunks and store the complete body in the cache at the end."""
+    limit = current_app.config.get("FEED_CACHE_MAX_BYTES", FEED_CACHE_MAX_BYTES)
+    chunks: list[bytes] | None = []
+    size = 0
+    for line in _feed_lines(teacher):
+        chunk = _fold(line).encode("utf-8")
+        if chunks is not None:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                chunks = None  # too large to cache; keep streaming only
+        yield chunk
+    if chunks is not None:
+        _store(teacher.campus, teacher.id, etag, b"".join(chunks), limit)
+
+
+def _store(campus: str, teacher_id: int, etag: str, body: bytes, limit: int) -> None:
+    global _feed_cache_bytes
+    with _feed_cache_lock:
+        _discard(campus, teacher_id)
+        _feed_cache[(campus, teacher_id)] = (etag, body)
+        _feed_cache_bytes += len(body)
+        while _feed_cache_bytes > limit:
+            _, (_, evicted) = _feed_cache.popitem(last=False)
+            _feed_cache_bytes -= len(evicted)
+
+
+def _discard(campus: str, teacher_id: int) -> None:
+    """Remove one entry; the caller holds ``_feed_cache_lock``."""
+    global _feed_cache_bytes
+    entry = _feed_cache.pop((campus, teacher_id), None)
+    if entry is not None:
+        _feed_cache_bytes -= len(entry[1])
+
+
+def _feed_lines(teacher: User) -> Iterator[str]:
+    stamp = _format_datetime(teacher.schedule_updated_at or datetime.utcnow())
+    yield "BEGIN:VCALENDAR"
+    yield "VERSION:2.0"
+    yield "PRODID:-//edushift//teacher feed//JA"
+    yield "CALSCALE:GREGORIAN"
+    yield f"X-WR-CALNAME:{_escape(teacher.name)} (edushift)"
+
+    # Both queries are already sorted by date, so a heap merge keeps the whole
+    # feed in date order while holding only one batch of each in memory.
+    shifts = (
+        db.session.query(Shift.id, Shift.date, Shift.start_time, Shift.end_time)
+        .filter(Shift.campus == teacher.campus, Shift.user_id == teacher.id)
+        .order_by(Shift.date.asc(), Shift.start_time.asc())
+        .yield_per(_STREAM_BATCH_SIZE)
+    )
+    lessons = (
+        db.session.query(
+            Lesson.id, Lesson.date, Lesson.status, Lesson.notes, Student.name.label("student_name")
+        )
+        .join(Student, Lesson.student_id == Student.id)
+        .filter(
+            Lesson.campus == teacher.campus,
+            Lesson.teacher_id == teacher.id,
+            Student.deleted_at.is_(None),
+        )
+        .order_by(Lesson.date.asc(), Lesson.id.asc())
+        .yield_per(_STREAM_BATCH_SIZE)
+    )
+    events = heapq.merge(
+        ((row.date, 0, row) for row in shifts),
+        ((row.date, 1, row) for row in lessons),
+        key=lambda item: (item[0], item[1]),
+    )
+    for _, kind, row in events:
+        if kind == 0:
+            yield from _shift_event(row, stamp)
+        else:
+            yield from _lesson_event(row, stamp)
+
+    yield "END:VCALENDAR"
+
+
+def _shift_event(row, stamp: str) -> Iterator[str]:
+    day = row.date.strftime("%Y%m%d")
+    yield "BEGIN:VEVENT"
+    yield f"UID:shift-{row.id}@edushift"
+    yield f"DTSTAMP:{stamp}"
+    yield f"DTSTART:{day}T{_format_time(row.start_time)}"
+    yield f"DTEND:{day}T{_format_time(row.end_time)}"
+    yield "SUMMARY:シフト"
+    yield "END:VEVENT"
+
+
+def _lesson_event(row, stamp: str) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:lesson-{row.id}@edushift"
+    yield f"DTSTAMP:{stamp}"
+    yield f"DTSTART;VALUE=DATE:{row.date.strftime('%Y%m%d')}"
+    yield f"SUMMARY:{_escape(f'授業: {row.student_name} ({row.status})')}"
+    if row.notes:
+        yield f"DESCRIPTION:{_escape(row.notes)}"
+    yield "END:VEVENT"
+
+
+def _format_datetime(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _format_time(value: str) -> str:
+    """Turn ``HH:MM`` or ``HH:MM:SS`` into the iCalendar ``HHMMSS`` form."""
+    parts = (value.split(":") + ["00", "00"])[:3]
+    return "".join(part.zfill(2) for part in parts)
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets as required by RFC 5545."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts: list[str] = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = char
+            limit = 74  # continuation lines start with a space
+        else:
+            current += char
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask, current_app, g
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .campus import configured_campuses
+from .models import Job, Lesson, Shift, Student, User
+
+Reporter = Callable[[int, "str | None"], None]
+Handler = Callable[[Job, Reporter], None]
+
+_handlers: dict[str, Handler] = {}
+
+POLL_INTERVAL = 2.0
+RETRY_BASE_DELAY = 30
+STALE_AFTER = timedelta(minutes=30)
+PURGE_BATCH_SIZE = 500
+PURGE_PAUSE = 0.05
+
+
+def init_app(app: Flask) -> None:
+    """Register the job worker CLI command."""
+    app.cli.add_command(worker_command)
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register a function as the handler for jobs of ``kind``."""
+
+    def register(func: Handler) -> Handler:
+        _handlers[kind] = func
+        return func
+
+    return register
+
+
+def enqueue(kind: str, payload: dict, campus: str, max_attempts: int = 3) -> Job:
+    """Add a job to the session; the caller commits it with its own transaction."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(campus=campus, kind=kind, payload=payload, max_attempts=max_attempts)
+    db.session.add(job)
+    return job
+
+
+def claim_next(campus: str, worker_id: str) -> Job | None:
+    """Atomically move the oldest runnable job of a campus to ``running``."""
+    now = datetime.utcnow()
+
+    # Jobs whose worker stopped reporting (it died mid-run) go back to the
+    # queue, or fail once they have used up their attempts.
+    stale = [
+        Job.campus == campus,
+        Job.status == "running",
+        func.coalesce(Job.heartbeat_at, Job.started_at) < now - STALE_AFTER,
+    ]
+    db.session.query(Job).filter(*stale, Job.attempts >= Job.max_attempts).update(
+        {
+            Job.status: "failed",
+            Job.locked_by: None,
+            Job.finished_at: now,
+            Job.message: "Worker stopped responding.",
+        },
+        synchronize_session=False,
+    )
+    db.session.query(Job).filter(*stale, Job.attempts < Job.max_attempts).update(
+        {Job.status: "queued", Job.locked_by: None}, synchronize_session=False
+    )
+    db.session.commit()
+
+    candidate = (
+        db.session.query(Job.id)
+        .filter(Job.campus == campus, Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after.asc(), Job.id.asc())
+        .first()
+    )
+    if candidate is None:
+        return None
+
+    claimed = (
+        db.session.query(Job)
+        .filter(Job.id == candidate.id, Job.status == "queued")
+        .update(
+            {
+                Job.status: "running",
+                Job.locked_by: worker_id,
+                Job.started_at: now,
+                Job.heartbeat_at: now,
+                Job.attempts: Job.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    if claimed != 1:
+        return None  # another worker got there first
+    return db.session.get(Job, candidate.id)
+
+
+def run_job(job: Job) -> None:
+    """Run a claimed job, recording progress, success, or a retry/failure."""
+
+    def report(progress: int, message: str | None = None) -> None:
+        job.progress = max(0, min(100, progress))
+        job.heartbeat_at = datetime.utcnow()
+        if message is not None:
+            job.message = message
+        db.session.commit()
+
+    try:
+        _handlers[job.kind](job, report)
+    except Exception as exc:  # noqa: BLE001 - any handler failure is recorded on the job
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.message = f"{type(exc).__name__}: {exc}"
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Job {job.id} ({job.kind}) error: {exc}")
+        return
+
+    job.status = "succeeded"
+    job.progress = 100
+    job.locked_by = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def work(app: Flask, worker_id: str, stop: threading.Event, once: bool = False) -> None:
+    """Poll every campus for jobs until ``stop`` is set (or the queue drains when ``once``)."""
+    while not stop.is_set():
+        ran_any = False
+        with app.app_context():
+            for campus in configured_campuses():
+                g.campus = campus
+                try:
+                    job = claim_next(campus, worker_id)
+                    if job is not None:
+                        run_job(job)
+                        ran_any = True
+                except SQLAlchemyError as exc:
+                    db.session.rollback()
+                    print(f"Job worker {worker_id} error: {exc}")
+        if once and not ran_any:
+            return
+        if not ran_any:
+            stop.wait(POLL_INTERVAL)
+
+
+@click.command("jobs-worker")
+@with_appcontext
+@click.option("--threads", default=2, show_default=True, help="Worker threads to start.")
+@click.option("--once", is_flag=True, help="Exit once the queue is empty.")
+def worker_command(threads: int, once: bool) -> None:
+    """Run background jobs. Start several processes to scale beyond one machine."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(target=work, args=(app, f"{prefix}:{n}", stop, once), daemon=True)
+        for n in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    click.echo(f"Started {threads} job worker thread(s).")
+    try:
+        while any(thread.is_alive() for thread in workers):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in workers:
+            thread.join()
+
+
+def _delete_in_batches(model, criteria: list, report: Reporter, start: int, end: int) -> None:
+    """Delete matching rows a batch at a time, committing after each batch.
+
+    Each transaction holds its locks only for one bounded DELETE, so other
+    writers can interleave while a long history is removed.
+    """
+    # No ORDER BY: with it SQLite sorts every remaining row per batch. Without
+    # it each batch reads the first rows of the index range, and the rows
+    # deleted by earlier batches are no longer there.
+    batch_size = current_app.config.get("PURGE_BATCH_SIZE", PURGE_BATCH_SIZE)
+    pause = current_app.config.get("PURGE_PAUSE", PURGE_PAUSE)
+    total = db.session.query(model.id).filter(*criteria).count()
+    done = 0
+    while True:
+        ids = [
+            row.id
+            for row in db.session.query(model.id).filter(*criteria).limit(batch_size)
+        ]
+        if not ids:
+            break
+        db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        done += len(ids)
+        progress = start + (end - start) * done // max(total, 1)
+        report(progress, f"{model.__tablename__}: {done}/{total}")
+        if pause:
+            time.sleep(pause)
+
+
+@handler("delete_user")
+def delete_user_job(job: Job, report: Reporter) -> None:
+    user_id = int(job.payload["user_id"])
+    campus = job.campus
+    affected_students = [
+        row.student_id
+        for row in db.session.query(Lesson.student_id)
+        .filter_by(campus=campus, teacher_id=user_id)
+        .distinct()
+    ]
+    _delete_in_batches(
+        Lesson, [Lesson.campus == campus, Lesson.teacher_id == user_id], report, 0, 60
+    )
+    # As for feeds, invalidate the rollups only after the last lesson batch.
+    db.session.query(Student).filter(Student.id.in_(affected_students)).update(
+        {Student.lessons_updated_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    _delete_in_batches(Shift, [Shift.campus == campus, Shift.user_id == user_id], report, 60, 95)
+    db.session.query(User).filter_by(campus=campus, id=user_id).delete()
+    db.session.commit()
+
+    from . import ical  # only needed here and by the feed view
+
+    ical.forget_feed(campus, user_id)
+
+
+@handler("delete_student")
+def delete_student_job(job: Job, report: Reporter) -> None:
+    student_id = int(job.payload["student_id"])
+    campus = job.campus
+    affected_teachers = [
+        row.teacher_id
+        for row in db.session.query(Lesson.teacher_id)
+        .filter_by(campus=campus, student_id=student_id)
+        .distinct()
+    ]
+    _delete_in_batches(
+        Lesson, [Lesson.campus == campus, Lesson.student_id == student_id], report, 0, 95
+    )
+    # Bump the feeds only once the lessons are gone, so a feed cached while
+    # the purge was running is not served under the final stamp.
+    db.session.query(User).filter(User.id.in_(affected_teachers)).update(
+        {User.schedule_updated_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.query(Student).filter_by(campus=campus, id=student_id).delete()
+    db.session.commit()
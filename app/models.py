@@ -1,4 +1,5 @@
-from datetime import date
+import secrets
+from datetime import date, datetime
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -7,12 +8,17 @@ from . import db
 
 class User(db.Model):
     __tablename__ = "users"
+    __table_args__ = (db.Index("ix_users_campus_role_name", "campus", "role", "name"),)
 
     id = db.Column(db.Integer, primary_key=True)
+    campus = db.Column(db.String(32), nullable=False)
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)
+    calendar_token = db.Column(db.String(64), unique=True, index=True)
+    schedule_updated_at = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
 
     shifts = db.relationship(
         "Shift",
@@ -34,13 +40,27 @@ class User(db.Model):
     def check_password(self, raw_password: str) -> bool:
         return check_password_hash(self.password, raw_password)
 
+    def ensure_calendar_token(self) -> str:
+        """Return the teacher's iCalendar feed token, issuing one on first use."""
+        if not self.calendar_token:
+            self.calendar_token = secrets.token_urlsafe(24)
+        return self.calendar_token
+
+    def touch_schedule(self) -> None:
+        """Record that this teacher's shifts or lessons changed (invalidates the feed)."""
+        self.schedule_updated_at = datetime.utcnow()
+
 
 class Student(db.Model):
     __tablename__ = "students"
+    __table_args__ = (db.Index("ix_students_campus_name", "campus", "name"),)
 
     id = db.Column(db.Integer, primary_key=True)
+    campus = db.Column(db.String(32), nullable=False)
     name = db.Column(db.String(120), nullable=False)
     grade = db.Column(db.String(50))
+    deleted_at = db.Column(db.DateTime)
+    lessons_updated_at = db.Column(db.DateTime)
 
     lessons = db.relationship(
         "Lesson",
@@ -49,11 +69,20 @@ class Student(db.Model):
         lazy="dynamic",
     )
 
+    def touch_lessons(self) -> None:
+        """Record that this student's lessons changed (invalidates cached rollups)."""
+        self.lessons_updated_at = datetime.utcnow()
+
 
 class Shift(db.Model):
     __tablename__ = "shifts"
+    __table_args__ = (
+        db.Index("ix_shifts_campus_date", "campus", "date", "start_time"),
+        db.Index("ix_shifts_campus_user_date", "campus", "user_id", "date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    campus = db.Column(db.String(32), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     date = db.Column(db.Date, nullable=False, default=date.today)
     start_time = db.Column(db.String(10), nullable=False)
@@ -64,8 +93,15 @@ class Shift(db.Model):
 
 class Lesson(db.Model):
     __tablename__ = "lessons"
+    __table_args__ = (
+        db.Index("ix_lessons_campus_date", "campus", "date"),
+        db.Index("ix_lessons_campus_status_date", "campus", "status", "date"),
+        db.Index("ix_lessons_campus_teacher_date", "campus", "teacher_id", "date"),
+        db.Index("ix_lessons_campus_student_date", "campus", "student_id", "date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    campus = db.Column(db.String(32), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey("students.id"), nullable=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     date = db.Column(db.Date, nullable=False, default=date.today)
@@ -74,3 +110,24 @@ class Lesson(db.Model):
 
     student = db.relationship("Student", back_populates="lessons")
     teacher = db.relationship("User", back_populates="lessons", foreign_keys=[teacher_id])
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (db.Index("ix_jobs_campus_status_run_after", "campus", "status", "run_after"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    campus = db.Column(db.String(32), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(100))
@@ -1,29 +1,91 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 from flask import (
     Blueprint,
+    Response,
+    abort,
     g,
     redirect,
     render_template,
     request,
     session,
+    stream_template,
+    stream_with_context,
     url_for,
 )
+from sqlalchemy import and_, or_, tuple_
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from . import db
-from .models import Lesson, Shift, Student, User
+from . import db, jobs, validation
+from .campus import configured_campuses, current_campus
+from .models import Job, Lesson, Shift, Student, User
 
 bp = Blueprint("main", __name__)
 
+LISTING_BATCH_SIZE = 200
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _coalesce(parts, size: int = STREAM_CHUNK_SIZE):
+    """Join the small pieces a streamed template yields into chunks of about ``size``."""
+    buffer: list[str] = []
+    length = 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _keyset_batches(query, order_by, after, size: int = LISTING_BATCH_SIZE):
+    """Yield the rows of ``query`` in ``order_by`` order, one short transaction per batch.
+
+    Each batch resumes after the last row of the previous one (``after``
+    builds that condition) and the transaction is closed before the rows are
+    handed on. A slow client reading a streamed page therefore never holds a
+    read lock that would block writers.
+    """
+    last = None
+    while True:
+        batch = query if last is None else query.filter(after(last))
+        rows = batch.order_by(*order_by).limit(size).all()
+        db.session.commit()
+        yield from rows
+        if len(rows) < size:
+            return
+        last = rows[-1]
+
 
 @bp.before_app_request
-def load_logged_in_user() -> None:
-    """Attach the logged-in user to flask.g for later use."""
+def load_logged_in_user():
+    """Attach the current campus and logged-in user to flask.g for later use.
+
+    Views authorise from the session, so a session whose user has since been
+    deleted (or moved campus) is cleared here and sent back to the login page.
+    """
+    campus = session.get("user_campus")
+    if not campus and request.method == "POST":
+        campus = request.form.get("campus")
+    g.campus = campus if campus in configured_campuses() else None
+
     user_id = session.get("user_id")
-    g.user = db.session.get(User, user_id) if user_id else None
+    user = db.session.get(User, user_id) if user_id else None
+    g.user = user if user and user.campus == current_campus() and not user.deleted_at else None
+    if user_id and g.user is None:
+        session.clear()
+        return redirect(url_for("main.login"))
+    return None
+
+
+@bp.app_context_processor
+def inject_campuses() -> dict:
+    """Expose the campus list so login/register can offer a campus selector."""
+    return {"campuses": configured_campuses()}
 
 
 @bp.route("/", methods=["GET"], endpoint="index")
@@ -49,11 +111,14 @@ def login():
         password = request.form.get("password", "")
 
         try:
-            user = User.query.filter_by(email=email).first()
+            user = User.query.filter_by(
+                campus=current_campus(), email=email, deleted_at=None
+            ).first()
             if user and user.check_password(password):
                 session["user_id"] = user.id
                 session["user_role"] = user.role
                 session["user_name"] = user.name
+                session["user_campus"] = user.campus
                 return redirect(url_for("main.index"))
             error = "メールアドレスまたはパスワードが違います。"
         except SQLAlchemyError as exc:
@@ -84,7 +149,7 @@ def register():
             if User.query.filter_by(email=email).first():
                 error = "このメールアドレスは既に使用されています。"
             else:
-                user = User(name=name, email=email, role="teacher")
+                user = User(campus=current_campus(), name=name, email=email, role="teacher")
                 user.set_password(password)
                 db.session.add(user)
                 db.session.commit()
@@ -114,6 +179,7 @@ def teacher_shift():
         return redirect(url_for("main.login"))
 
     user_id = session["user_id"]
+    campus = current_campus()
     error: str | None = None
     form_data: dict[str, str] = {
         "shift_id": "",
@@ -125,7 +191,7 @@ def teacher_shift():
 
     edit_id = request.args.get("edit", type=int)
     if edit_id is not None:
-        edit_query = Shift.query.filter_by(id=edit_id)
+        edit_query = Shift.query.filter_by(campus=campus, id=edit_id)
         if session.get("user_role") == "teacher":
             edit_query = edit_query.filter_by(user_id=user_id)
         edit_shift = edit_query.first()
@@ -166,7 +232,7 @@ def teacher_shift():
         else:
             try:
                 if shift_id:
-                    shift = Shift.query.filter_by(id=int(shift_id)).first()
+                    shift = Shift.query.filter_by(campus=campus, id=int(shift_id)).first()
                     if not shift or (
                         session.get("user_role") == "teacher" and shift.user_id != user_id
                     ):
@@ -175,16 +241,19 @@ def teacher_shift():
                         shift.date = shift_date
                         shift.start_time = start_time
                         shift.end_time = end_time
+                        shift.teacher.touch_schedule()
                         db.session.commit()
                         return redirect(url_for("main.teacher_shift"))
                 else:
                     shift = Shift(
+                        campus=campus,
                         user_id=user_id,
                         date=shift_date,
                         start_time=start_time,
                         end_time=end_time,
                     )
                     db.session.add(shift)
+                    db.session.get(User, user_id).touch_schedule()
                     db.session.commit()
                     return redirect(url_for("main.teacher_shift"))
             except SQLAlchemyError as exc:
@@ -193,17 +262,33 @@ def teacher_shift():
                 error = "シフトの保存中にエラーが発生しました。"
 
     shifts = (
-        Shift.query.filter_by(user_id=user_id)
+        Shift.query.filter_by(campus=campus, user_id=user_id)
         .order_by(Shift.date.asc(), Shift.start_time.asc())
         .all()
     )
 
+    calendar_url: str | None = None
+    teacher = db.session.get(User, user_id)
+    if teacher:
+        try:
+            issued = not teacher.calendar_token
+            token = teacher.ensure_calendar_token()
+            if issued:
+                db.session.commit()
+            calendar_url = url_for(
+                "main.teacher_calendar", campus=campus, token=token, _external=True
+            )
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            print(f"Calendar token error: {exc}")
+
     return render_template(
         "teacher_shift.html",
         shifts=shifts,
         error=error,
         form_data=form_data,
         is_edit_mode=is_edit_mode,
+        calendar_url=calendar_url,
     )
 
 
@@ -213,13 +298,14 @@ def delete_shift(shift_id: int):
     if session.get("user_role") not in {"teacher", "admin"}:
         return redirect(url_for("main.login"))
 
-    query = Shift.query.filter_by(id=shift_id)
+    query = Shift.query.filter_by(campus=current_campus(), id=shift_id)
     if session.get("user_role") == "teacher":
         query = query.filter_by(user_id=session["user_id"])
 
     shift = query.first()
     if shift:
         try:
+            shift.teacher.touch_schedule()
             db.session.delete(shift)
             db.session.commit()
         except SQLAlchemyError as exc:
@@ -229,12 +315,43 @@ def delete_shift(shift_id: int):
     return redirect(url_for("main.teacher_shift"))
 
 
+@bp.route("/calendar/<campus>/<token>.ics", methods=["GET"], endpoint="teacher_calendar")
+def teacher_calendar(campus: str, token: str):
+    """Serve a teacher's shifts and lessons as an iCalendar feed for polling clients."""
+    if campus not in configured_campuses():
+        abort(404)
+    g.campus = campus
+
+    teacher = User.query.filter_by(
+        campus=campus, calendar_token=token, deleted_at=None
+    ).first()
+    if not teacher:
+        abort(404)
+
+    from . import ical  # only calendar clients need the feed renderer
+
+    etag = ical.feed_etag(teacher)
+    headers = {"Cache-Control": "private, no-cache"}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    body = ical.cached_feed(teacher, etag)
+    if body is None:
+        body = stream_with_context(ical.stream_feed(teacher, etag))
+    response = Response(body, mimetype="text/calendar", headers=headers)
+    response.set_etag(etag)
+    return response
+
+
 @bp.route("/lesson/manage", methods=["GET", "POST"], endpoint="lesson_manage")
 def lesson_manage():
     """Register lessons and show recent history."""
     if not session.get("user_id"):
         return redirect(url_for("main.login"))
 
+    campus = current_campus()
     error: str | None = None
 
     if request.method == "POST":
@@ -246,14 +363,25 @@ def lesson_manage():
 
         try:
             lesson_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            student = Student.query.filter_by(
+                campus=campus, id=int(student_id), deleted_at=None
+            ).first()
+            teacher = User.query.filter_by(
+                campus=campus, id=int(teacher_id), deleted_at=None
+            ).first()
+            if not student or not teacher:
+                raise ValueError("student or teacher belongs to another campus")
             lesson = Lesson(
-                student_id=int(student_id),
-                teacher_id=int(teacher_id),
+                campus=campus,
+                student_id=student.id,
+                teacher_id=teacher.id,
                 date=lesson_date,
                 status=status,
                 notes=notes or None,
             )
             db.session.add(lesson)
+            teacher.touch_schedule()
+            student.touch_lessons()
             db.session.commit()
             return redirect(url_for("main.lesson_manage"))
         except (TypeError, ValueError):
@@ -263,8 +391,14 @@ def lesson_manage():
             print(f"Lesson registration error: {exc}")
             error = "授業登録中にエラーが発生しました。"
 
-    students = Student.query.order_by(Student.name.asc()).all()
-    teachers = User.query.filter_by(role="teacher").order_by(User.name.asc()).all()
+    students = (
+        Student.query.filter_by(campus=campus, deleted_at=None).order_by(Student.name.asc()).all()
+    )
+    teachers = (
+        User.query.filter_by(campus=campus, role="teacher", deleted_at=None)
+        .order_by(User.name.asc())
+        .all()
+    )
 
     lessons_query = (
         db.session.query(
@@ -272,11 +406,17 @@ def lesson_manage():
             Lesson.date,
             Lesson.status,
             Lesson.notes,
+            Lesson.student_id,
             Student.name.label("student_name"),
             User.name.label("teacher_name"),
         )
         .join(Student, Lesson.student_id == Student.id)
         .join(User, Lesson.teacher_id == User.id)
+        .filter(
+            Lesson.campus == campus,
+            Student.deleted_at.is_(None),
+            User.deleted_at.is_(None),
+        )
         .order_by(Lesson.date.desc())
         .limit(50)
     )
@@ -286,6 +426,7 @@ def lesson_manage():
             "date": row.date,
             "status": row.status,
             "notes": row.notes,
+            "student_id": row.student_id,
             "student_name": row.student_name,
             "teacher_name": row.teacher_name,
         }
@@ -298,6 +439,43 @@ def lesson_manage():
         teachers=teachers,
         lessons=lessons,
         error=error,
+        today=date.today().isoformat(),
+    )
+
+
+@bp.route("/students/<int:student_id>", methods=["GET"], endpoint="student_detail")
+def student_detail(student_id: int):
+    """Show one student's lesson history with attendance statistics."""
+    if not session.get("user_id"):
+        return redirect(url_for("main.login"))
+
+    campus = current_campus()
+    student = Student.query.filter_by(campus=campus, id=student_id, deleted_at=None).first()
+    if not student:
+        abort(404)
+
+    from . import stats
+
+    rollup = stats.student_rollup(student)
+    history = (
+        db.session.query(
+            Lesson.id,
+            Lesson.date,
+            Lesson.status,
+            Lesson.notes,
+            User.name.label("teacher_name"),
+        )
+        .join(User, Lesson.teacher_id == User.id)
+        .filter(Lesson.campus == campus, Lesson.student_id == student.id)
+        .order_by(Lesson.date.desc(), Lesson.id.desc())
+        .paginate(page=request.args.get("page", 1, type=int), per_page=50, error_out=False)
+    )
+
+    return render_template(
+        "student_detail.html",
+        student=student,
+        rollup=rollup,
+        history=history,
     )
 
 
@@ -307,6 +485,7 @@ def admin_dashboard():
     if session.get("user_role") != "admin":
         return redirect(url_for("main.login"))
 
+    campus = current_campus()
     all_shifts_query = (
         db.session.query(
             Shift.date,
@@ -315,6 +494,7 @@ def admin_dashboard():
             User.name.label("teacher_name"),
         )
         .join(User, Shift.user_id == User.id)
+        .filter(Shift.campus == campus, User.deleted_at.is_(None))
         .order_by(Shift.date.asc(), Shift.start_time.asc())
         .limit(50)
     )
@@ -337,7 +517,12 @@ def admin_dashboard():
         )
         .join(Student, Lesson.student_id == Student.id)
         .join(User, Lesson.teacher_id == User.id)
-        .filter(Lesson.status.in_(["欠席", "振替"]))
+        .filter(
+            Lesson.campus == campus,
+            Lesson.status.in_(["欠席", "振替"]),
+            Student.deleted_at.is_(None),
+            User.deleted_at.is_(None),
+        )
         .order_by(Lesson.date.desc())
         .limit(30)
     )
@@ -364,6 +549,7 @@ def manage_users():
     if session.get("user_role") != "admin":
         return redirect(url_for("main.index"))
 
+    campus = current_campus()
     error: str | None = None
 
     if request.method == "POST":
@@ -376,7 +562,7 @@ def manage_users():
                 password = request.form.get("password", "")
                 role = request.form.get("role", "teacher")
 
-                user = User(name=name, email=email, role=role)
+                user = User(campus=campus, name=name, email=email, role=role)
                 user.set_password(password)
                 db.session.add(user)
                 db.session.commit()
@@ -384,21 +570,41 @@ def manage_users():
             elif action == "add_student":
                 name = request.form.get("name", "").strip()
                 grade = request.form.get("grade", "").strip()
-                student = Student(name=name, grade=grade or None)
+                student = Student(campus=campus, name=name, grade=grade or None)
                 db.session.add(student)
                 db.session.commit()
 
+            # Deletions can touch years of history: hide the row now and let the
+            # job worker purge its dependents in small batches.
             elif action == "delete_user":
+                from . import ical
+
                 user_id = int(request.form.get("id"))
-                db.session.query(Shift).filter_by(user_id=user_id).delete()
-                db.session.query(User).filter_by(id=user_id).delete()
+                db.session.query(User).filter_by(campus=campus, id=user_id).update(
+                    {User.deleted_at: datetime.utcnow()}
+                )
+                job = jobs.enqueue("delete_user", {"user_id": user_id}, campus=campus)
                 db.session.commit()
+                ical.forget_feed(campus, user_id)
+                return redirect(url_for("main.job_status", job_id=job.id))
 
             elif action == "delete_student":
                 student_id = int(request.form.get("id"))
-                db.session.query(Lesson).filter_by(student_id=student_id).delete()
-                db.session.query(Student).filter_by(id=student_id).delete()
+                db.session.query(Student).filter_by(campus=campus, id=student_id).update(
+                    {Student.deleted_at: datetime.utcnow()}
+                )
+                # The student's lessons drop out of their teachers' feeds now.
+                affected_teachers = (
+                    db.session.query(Lesson.teacher_id)
+                    .filter_by(campus=campus, student_id=student_id)
+                    .distinct()
+                )
+                db.session.query(User).filter(User.id.in_(affected_teachers)).update(
+                    {User.schedule_updated_at: datetime.utcnow()}, synchronize_session=False
+                )
+                job = jobs.enqueue("delete_student", {"student_id": student_id}, campus=campus)
                 db.session.commit()
+                return redirect(url_for("main.job_status", job_id=job.id))
         except IntegrityError:
             db.session.rollback()
             error = "データの重複エラーが発生しました。"
@@ -413,12 +619,93 @@ def manage_users():
         return redirect(url_for("main.manage_users", error=error))
 
     error = request.args.get("error")
-    users = User.query.order_by(User.role.desc(), User.name.asc()).all()
-    students = Student.query.order_by(Student.name.asc()).all()
+
+    # Rows are read a batch at a time while the template streams, so neither
+    # list is ever held in full and the first bytes go out at once.
+    users = _keyset_batches(
+        db.session.query(User.id, User.name, User.email, User.role).filter(
+            User.campus == campus, User.deleted_at.is_(None)
+        ),
+        (User.role.desc(), User.name.asc(), User.id.asc()),
+        lambda last: or_(
+            User.role < last.role,
+            and_(User.role == last.role, tuple_(User.name, User.id) > (last.name, last.id)),
+        ),
+    )
+    students = _keyset_batches(
+        db.session.query(Student.id, Student.name, Student.grade).filter(
+            Student.campus == campus, Student.deleted_at.is_(None)
+        ),
+        (Student.name.asc(), Student.id.asc()),
+        lambda last: tuple_(Student.name, Student.id) > (last.name, last.id),
+    )
+
+    return Response(
+        _coalesce(
+            stream_template(
+                "manage_users.html",
+                users=users,
+                students=students,
+                error=error,
+            )
+        ),
+        mimetype="text/html",
+    )
+
+
+@bp.route("/admin/jobs", methods=["GET"], endpoint="job_list")
+def job_list():
+    """List recent background jobs for the current campus."""
+    if session.get("user_role") != "admin":
+        return redirect(url_for("main.index"))
+
+    recent_jobs = (
+        Job.query.filter_by(campus=current_campus()).order_by(Job.id.desc()).limit(50).all()
+    )
+    return render_template("jobs.html", jobs=recent_jobs, job=None)
+
+
+@bp.route("/admin/jobs/<int:job_id>", methods=["GET"], endpoint="job_status")
+def job_status(job_id: int):
+    """Show the progress of a single background job."""
+    if session.get("user_role") != "admin":
+        return redirect(url_for("main.index"))
+
+    job = Job.query.filter_by(campus=current_campus(), id=job_id).first()
+    if not job:
+        abort(404)
+    return render_template("jobs.html", jobs=[job], job=job)
+
+
+@bp.route("/admin/validation", methods=["GET"], endpoint="schedule_validation")
+def schedule_validation():
+    """Check lessons against teacher shifts over a date range."""
+    if session.get("user_role") != "admin":
+        return redirect(url_for("main.index"))
+
+    error: str | None = None
+    today = date.today()
+    start_str = request.args.get("start") or (today - timedelta(days=30)).isoformat()
+    end_str = request.args.get("end") or (today + timedelta(days=30)).isoformat()
+    violations: list[validation.Violation] = []
+
+    try:
+        start = datetime.strptime(start_str, "%Y-%m-%d").date()
+        end = datetime.strptime(end_str, "%Y-%m-%d").date()
+    except ValueError:
+        error = "日付の形式が正しくありません。"
+    else:
+        try:
+            violations = validation.validate_schedule(current_campus(), start, end)
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            print(f"Schedule validation error: {exc}")
+            error = "検証中にエラーが発生しました。"
 
     return render_template(
-        "manage_users.html",
-        users=users,
-        students=students,
+        "schedule_validation.html",
+        violations=violations,
+        start=start_str,
+        end=end_str,
         error=error,
     )
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from datetime import date
+
+from sqlalchemy import case, func
+
+from . import db
+from .models import Lesson, Student
+
+# Rollups keyed by (campus, student id); each entry remembers the student's
+# lessons_updated_at it was computed for, so any lesson write misses the cache.
+_rollup_cache: dict[tuple[str, int], tuple[object, StudentRollup]] = {}
+_rollup_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class StudentRollup:
+    total: int
+    attended: int
+    absent: int
+    makeup: int
+    first_date: date | None
+    last_date: date | None
+
+    def rate(self, count: int) -> float:
+        return count / self.total * 100 if self.total else 0.0
+
+    @property
+    def attendance_rate(self) -> float:
+        return self.rate(self.attended)
+
+    @property
+    def absence_rate(self) -> float:
+        return self.rate(self.absent)
+
+    @property
+    def makeup_rate(self) -> float:
+        return self.rate(self.makeup)
+
+
+def student_rollup(student: Student) -> StudentRollup:
+    """Return lesson counts for a student, computed once per lessons_updated_at."""
+    key = (student.campus, student.id)
+    stamp = student.lessons_updated_at
+    with _rollup_cache_lock:
+        entry = _rollup_cache.get(key)
+    if entry and entry[0] == stamp:
+        return entry[1]
+
+    # One aggregate over the (campus, student_id, date) index range.
+    row = (
+        db.session.query(
+            func.count(Lesson.id),
+            func.sum(case((Lesson.status == "通常", 1), else_=0)),
+            func.sum(case((Lesson.status == "欠席", 1), else_=0)),
+            func.sum(case((Lesson.status == "振替", 1), else_=0)),
+            func.min(Lesson.date),
+            func.max(Lesson.date),
+        )
+        .filter(Lesson.campus == student.campus, Lesson.student_id == student.id)
+        .one()
+    )
+    rollup = StudentRollup(
+        total=row[0] or 0,
+        attended=row[1] or 0,
+        absent=row[2] or 0,
+        makeup=row[3] or 0,
+        first_date=row[4],
+        last_date=row[5],
+    )
+    with _rollup_cache_lock:
+        _rollup_cache[key] = (stamp, rollup)
+    return rollup
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import click
+from flask import Flask, g
+from flask.cli import with_appcontext
+
+from . import db
+from .campus import configured_campuses
+from .models import Lesson, Shift, Student, User
+
+_STREAM_BATCH_SIZE = 1000
+
+
+@dataclass
+class Violation:
+    kind: str
+    date: date
+    teacher_id: int
+    teacher_name: str
+    detail: str
+
+
+def init_app(app: Flask) -> None:
+    """Register the schedule validation CLI command."""
+    app.cli.add_command(validate_schedule_command)
+
+
+def validate_schedule(campus: str, start: date, end: date) -> list[Violation]:
+    """Check lessons against shifts for one campus over ``[start, end]``.
+
+    Shifts and lessons are both streamed sorted by (teacher, date) from the
+    campus-leading indexes and merge-joined in a single pass, so only one
+    teacher-day of rows is held in memory at a time.
+    """
+    teacher_names = dict(db.session.query(User.id, User.name).filter(User.campus == campus))
+    # Soft-deleted teachers and students are already queued for purging.
+    deleted_teachers = {
+        row.id
+        for row in db.session.query(User.id).filter(
+            User.campus == campus, User.deleted_at.isnot(None)
+        )
+    }
+
+    shifts = iter(
+        db.session.query(Shift.id, Shift.user_id, Shift.date, Shift.start_time, Shift.end_time)
+        .filter(Shift.campus == campus, Shift.date >= start, Shift.date <= end)
+        .order_by(Shift.user_id.asc(), Shift.date.asc(), Shift.start_time.asc())
+        .yield_per(_STREAM_BATCH_SIZE)
+    )
+    lessons = iter(
+        db.session.query(
+            Lesson.id,
+            Lesson.teacher_id,
+            Lesson.date,
+            Lesson.status,
+            Student.name.label("student_name"),
+        )
+        .join(Student, Lesson.student_id == Student.id)
+        .filter(
+            Lesson.campus == campus,
+            Lesson.date >= start,
+            Lesson.date <= end,
+            Student.deleted_at.is_(None),
+        )
+        .order_by(Lesson.teacher_id.asc(), Lesson.date.asc())
+        .yield_per(_STREAM_BATCH_SIZE)
+    )
+
+    violations: list[Violation] = []
+    shift = next(shifts, None)
+    lesson = next(lessons, None)
+    while shift is not None or lesson is not None:
+        shift_key = (shift.user_id, shift.date) if shift is not None else None
+        lesson_key = (lesson.teacher_id, lesson.date) if lesson is not None else None
+        key = min(k for k in (shift_key, lesson_key) if k is not None)
+        teacher_id, day = key
+        name = teacher_names.get(teacher_id, f"#{teacher_id}")
+
+        day_shifts = []
+        while shift is not None and (shift.user_id, shift.date) == key:
+            day_shifts.append(shift)
+            shift = next(shifts, None)
+        day_lessons = []
+        while lesson is not None and (lesson.teacher_id, lesson.date) == key:
+            day_lessons.append(lesson)
+            lesson = next(lessons, None)
+        if teacher_id in deleted_teachers:
+            continue
+
+        latest_end = None
+        for item in day_shifts:
+            if latest_end is not None and item.start_time < latest_end:
+                violations.append(
+                    Violation(
+                        "double_booked",
+                        day,
+                        teacher_id,
+                        name,
+                        f"シフト #{item.id} ({item.start_time}〜{item.end_time}) が"
+                        f"他のシフトと重複しています",
+                    )
+                )
+            latest_end = max(latest_end or item.end_time, item.end_time)
+
+        if not day_shifts:
+            for item in day_lessons:
+                violations.append(
+                    Violation(
+                        "lesson_without_shift",
+                        day,
+                        teacher_id,
+                        name,
+                        f"授業 #{item.id} ({item.student_name}, {item.status}) の日に"
+                        f"シフトがありません",
+                    )
+                )
+
+    violations.sort(key=lambda v: (v.date, v.teacher_name))
+    return violations
+
+
+@click.command("validate-schedule")
+@with_appcontext
+@click.option(
+    "--from",
+    "start",
+    required=True,
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="First date to check.",
+)
+@click.option(
+    "--to",
+    "end",
+    required=True,
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Last date to check.",
+)
+@click.option("--campus", "campuses", multiple=True, help="Campus to check (default: all).")
+@click.pass_context
+def validate_schedule_command(
+    ctx: click.Context, start: datetime, end: datetime, campuses: tuple[str, ...]
+) -> None:
+    """Report lessons outside the teacher's shifts and overlapping shifts."""
+    start_date = start.date()
+    end_date = end.date()
+    total = 0
+    for campus in campuses or configured_campuses():
+        g.campus = campus
+        violations = validate_schedule(campus, start_date, end_date)
+        total += len(violations)
+        for v in violations:
+            click.echo(f"[{campus}] {v.date} {v.kind} {v.teacher_name}: {v.detail}")
+    click.echo(f"{total} violation(s) found.")
+    if total:
+        ctx.exit(1)
@@ -0,0 +1,121 @@
+"""Measure request-writer latency while an online backup of a large database runs.
+
+Usage: python bench_backup.py [--lessons 1000000] [--journal-mode wal|delete|both]
+                              [--write-interval 0.05]
+
+A writer thread keeps inserting lessons (one short transaction each, like a
+request) while the database is backed up first in a single step and then in
+incremental steps. Write latencies are reported for each mode.
+
+In rollback-journal ("delete") mode a single-step copy locks writers out
+for its whole duration, and an incremental copy gives up because every
+write restarts it. In WAL mode the incremental copy reads one snapshot and
+finishes without blocking writers.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from app import create_app, db
+from app.backup import BackupInterrupted, online_backup
+
+
+def build_database(path: str, lessons: int, journal_mode: str) -> None:
+    app = create_app(
+        {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "SQLITE_WAL": journal_mode == "wal"}
+    )
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute(
+        "INSERT INTO users (campus, name, email, password, role) "
+        "VALUES ('main', 'bench', 'bench@example.com', 'x', 'teacher')"
+    )
+    conn.execute("INSERT INTO students (campus, name) VALUES ('main', 'bench')")
+    start = date(2015, 1, 1)
+    rows = (
+        ("main", 1, 1, (start + timedelta(days=i % 3650)).isoformat(), "通常", "x" * 80)
+        for i in range(lessons)
+    )
+    conn.executemany(
+        "INSERT INTO lessons (campus, student_id, teacher_id, date, status, notes) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def writer(path: str, interval: float, stop: threading.Event, latencies: list[float]) -> None:
+    conn = sqlite3.connect(path, timeout=30)
+    while not stop.is_set():
+        began = time.perf_counter()
+        conn.execute(
+            "INSERT INTO lessons (campus, student_id, teacher_id, date, status) "
+            "VALUES ('main', 1, 1, '2026-01-01', '通常')"
+        )
+        conn.commit()
+        latencies.append((time.perf_counter() - began) * 1000)
+        time.sleep(interval)
+    conn.close()
+
+
+def run(path: str, target: str, interval: float, pages: int, pause: float) -> None:
+    latencies: list[float] = []
+    stop = threading.Event()
+    thread = threading.Thread(target=writer, args=(path, interval, stop, latencies))
+    thread.start()
+    time.sleep(0.2)
+    began = time.perf_counter()
+    try:
+        online_backup(path, target, pages=pages, pause=pause)
+        outcome = "backup"
+    except BackupInterrupted:
+        outcome = "gave up"
+    elapsed = time.perf_counter() - began
+    stop.set()
+    thread.join()
+    os.unlink(target)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    label = "single step" if pages < 0 else f"{pages} pages/step, {pause * 1000:.0f}ms pause"
+    print(
+        f"{label:32} {outcome:7} {elapsed:6.2f}s  writes {len(latencies):5d}  "
+        f"p50 {statistics.median(latencies):7.2f}ms  p99 {p99:7.2f}ms  "
+        f"max {latencies[-1]:8.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lessons", type=int, default=1_000_000)
+    parser.add_argument("--journal-mode", choices=["wal", "delete", "both"], default="both")
+    parser.add_argument(
+        "--write-interval", type=float, default=0.05, help="Seconds between writer commits."
+    )
+    args = parser.parse_args()
+
+    modes = ["delete", "wal"] if args.journal_mode == "both" else [args.journal_mode]
+    for journal_mode in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            build_database(path, args.lessons, journal_mode)
+            print(
+                f"Database: {os.path.getsize(path) / 1024 / 1024:.1f} MiB, "
+                f"{args.lessons} lessons, journal_mode={journal_mode}"
+            )
+            target = os.path.join(tmp, "snapshot.db")
+            for pages, pause in ((-1, 0), (256, 0.01), (1024, 0.005)):
+                run(path, target, args.write_interval, pages=pages, pause=pause)
+
+if __name__ == "__main__":
+    main()
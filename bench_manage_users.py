@@ -0,0 +1,131 @@
+"""Check that the streamed manage_users page keeps peak memory bounded.
+
+Usage: python bench_manage_users.py [--students 20000]
+
+Renders /manage/users for a roster of N and 4N students and records the
+tracemalloc peak and time to first byte. The peak must not grow with the
+roster size; the script exits non-zero if it does, or if it exceeds
+--max-peak-mib.
+
+It then pauses halfway through reading the page, as a slow browser would,
+and commits a student from a second connection with a 1 s busy timeout.
+WAL is off for this check, so it fails if the streamed listing holds a
+read lock.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app import create_app, db
+from app.models import Student, User
+
+
+def build_app(path: str, students: int, wal: bool = True):
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+            "JINJA_BYTECODE_CACHE_DIR": "",
+            "SQLITE_WAL": wal,
+            "TESTING": True,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        admin = User(campus="main", name="admin", email="admin@example.com", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.bulk_insert_mappings(
+            Student,
+            (
+                {"campus": "main", "name": f"生徒 {i:06d}", "grade": "中3 / 高校受験クラス"}
+                for i in range(students)
+            ),
+        )
+        db.session.commit()
+    return app
+
+
+def measure(app) -> tuple[float, float, int]:
+    client = app.test_client()
+    client.post("/login", data={"email": "admin@example.com", "password": "adminpass"})
+    client.get("/manage/users").close()  # warm up template and query caches
+
+    tracemalloc.start()
+    began = time.perf_counter()
+    response = client.get("/manage/users", buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first_byte = time.perf_counter() - began
+    for chunk in chunks:
+        size += len(chunk)
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, first_byte * 1000, size
+
+
+def write_during_stream(app, path: str) -> float:
+    """Commit a write while a streamed /manage/users response is paused mid-body."""
+    client = app.test_client()
+    client.post("/login", data={"email": "admin@example.com", "password": "adminpass"})
+    response = client.get("/manage/users", buffered=False)
+    chunks = iter(response.response)
+    for _ in range(5):
+        next(chunks)
+
+    conn = sqlite3.connect(path, timeout=1)
+    try:
+        began = time.perf_counter()
+        conn.execute("INSERT INTO students (campus, name) VALUES ('main', 'writer')")
+        conn.commit()
+        return (time.perf_counter() - began) * 1000
+    finally:
+        conn.close()
+        for _ in chunks:
+            pass
+        response.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--max-peak-mib", type=float, default=8.0)
+    args = parser.parse_args()
+
+    peaks = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (args.students, args.students * 4):
+            app = build_app(os.path.join(tmp, f"roster-{n}.db"), n)
+            peak, first_byte, size = measure(app)
+            peaks.append(peak)
+            print(
+                f"{n:7d} students  body {size / 1024 / 1024:6.1f} MiB  "
+                f"peak {peak:6.2f} MiB  first byte {first_byte:6.1f} ms"
+            )
+
+        path = os.path.join(tmp, "writer.db")
+        app = build_app(path, args.students, wal=False)
+        try:
+            write_ms = write_during_stream(app, path)
+        except sqlite3.OperationalError as exc:
+            print(f"FAIL: write while the page streams: {exc}")
+            return 1
+        print(f"write while the page streams (rollback journal): {write_ms:.1f} ms")
+
+    if peaks[-1] > args.max_peak_mib:
+        print(f"FAIL: peak {peaks[-1]:.2f} MiB exceeds {args.max_peak_mib} MiB")
+        return 1
+    if peaks[-1] > peaks[0] * 1.5 + 0.5:
+        print("FAIL: peak memory grows with the roster size")
+        return 1
+    print("OK: peak memory is bounded")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
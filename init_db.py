@@ -1,17 +1,55 @@
+from sqlalchemy import inspect, text
+
 from app import create_app, db
+from app.campus import campus_bind_key
 from app.models import User
 
 
+def _upgrade_schema(engine, backfill: dict[str, str]) -> None:
+    """Add columns and indexes introduced since an existing database was created.
+
+    Existing rows get the value from ``backfill`` for new NOT NULL columns
+    (e.g. ``campus``), so upgraded data lands on a configured campus.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                ddl += column.type.compile(dialect=engine.dialect)
+                if not column.nullable:
+                    ddl += f" NOT NULL DEFAULT '{backfill[column.name]}'"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 def init_db() -> None:
     """Create tables and ensure an admin user exists."""
     app = create_app()
     with app.app_context():
+        backfill = {"campus": app.config["DEFAULT_CAMPUS"]}
+        _upgrade_schema(db.engine, backfill)
         db.create_all()
+        for campus in app.config["CAMPUS_DATABASE_URLS"]:
+            engine = db.engines[campus_bind_key(campus)]
+            _upgrade_schema(engine, {"campus": campus})
+            db.metadata.create_all(engine)
 
         admin_email = "admin@example.com"
         admin = User.query.filter_by(email=admin_email).first()
         if not admin:
-            admin = User(name="管理者", email=admin_email, role="admin")
+            admin = User(
+                campus=app.config["DEFAULT_CAMPUS"],
+                name="管理者",
+                email=admin_email,
+                role="admin",
+            )
             admin.set_password("adminpass")
             db.session.add(admin)
             db.session.commit()
@@ -1,7 +1,62 @@
-from app import create_app
+import os
+import sys
+import time
 
+_started = time.perf_counter()
+from app import create_app  # noqa: E402  (timed for --profile-startup)
+
+_imported = time.perf_counter()
 app = create_app()
+_created = time.perf_counter()
+
+
+def profile_startup(target_ms: float) -> int:
+    """Report import, app-factory and template-compile time against a target."""
+    import subprocess
+
+    import_ms = (_imported - _started) * 1000
+    factory_ms = (_created - _imported) * 1000
+
+    began = time.perf_counter()
+    templates = app.jinja_env.list_templates(extensions=["html"])
+    for name in templates:
+        app.jinja_env.get_template(name)
+    compile_ms = (time.perf_counter() - began) * 1000
+
+    total_ms = import_ms + factory_ms + compile_ms
+    print(f"import app          {import_ms:8.1f} ms")
+    print(f"create_app()        {factory_ms:8.1f} ms")
+    print(f"load {len(templates):2d} templates   {compile_ms:8.1f} ms", end="")
+    cache_dir = app.config["JINJA_BYTECODE_CACHE_DIR"]
+    print(" (bytecode cache: " + (cache_dir if cache_dir else "off") + ")")
+    print(f"total               {total_ms:8.1f} ms (target {target_ms:.0f} ms)")
+
+    # Cumulative self-reported import times from a fresh interpreter.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # importtime indents each nesting level by two spaces; keep the
+        # top level and the modules imported directly by it.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            rows.append((int(cumulative), name.strip()))
+    print("\nslowest imports (top level and their direct imports):")
+    for cumulative, name in sorted(rows, reverse=True)[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    return 0 if total_ms <= target_ms else 1
 
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        target = float(os.getenv("STARTUP_TARGET_MS", "1500"))
+        sys.exit(profile_startup(target))
     app.run(debug=True)